@@ -0,0 +1,231 @@
+# Long-running lookup service that keeps roster and session data warm
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from zjx_utils import (STATS_URL, build_controller_record, build_obs_record,
+                       calculate_zjx_hours, fetch_roster, get_with_retry, is_inactive)
+
+class ActivityCache:
+    """
+    In-memory roster and per-CID session cache with TTL based refresh
+    Only the warm thread refreshes stale data, lookups always answer from the
+    cache and only fetch inline on a cold start. Hours are recalculated from
+    the cached sessions on every query so the 90 day window stays current
+    """
+    def __init__(self, roster_ttl=900, stats_ttl=3600, request_delay=3, lookup_retries=2):
+        self.roster_ttl = roster_ttl
+        self.stats_ttl = stats_ttl
+        self.request_delay = request_delay
+        self.lookup_retries = lookup_retries
+        self.lock = threading.Lock()
+        self.roster_lock = threading.Lock()
+        self.fetch_locks = {}
+        self.roster = None
+        self.roster_fetched = None
+        self.sessions = {}
+
+    def is_stale(self, fetched_at, ttl):
+        return fetched_at is None or monotonic() - fetched_at > ttl
+
+    def refresh_roster(self):
+        """Fetch the roster unless another thread already refreshed it, keeping the old roster on failure"""
+        with self.roster_lock:
+            if self.roster is not None and not self.is_stale(self.roster_fetched, self.roster_ttl):
+                return self.roster
+
+            try:
+                roster = {controller['cid']: controller for controller in fetch_roster(conditional=True)}
+            except Exception as e:
+                if self.roster is None:
+                    raise
+                print(f"Error refreshing roster, keeping cached roster: {e}")
+                return self.roster
+
+            with self.lock:
+                self.roster = roster
+                self.roster_fetched = monotonic()
+                # Forget members who left the roster
+                for cid in list(self.sessions):
+                    if cid not in roster:
+                        del self.sessions[cid]
+            return roster
+
+    def get_roster(self):
+        """Cached roster indexed by CID, even if stale, only fetched here on a cold start"""
+        roster = self.roster
+        if roster is None:
+            roster = self.refresh_roster()
+        return roster
+
+    def fetch_sessions(self, cid, max_retries=10, timeout=None):
+        """
+        Fetch the ATC sessions for a CID unless another thread already has fresh ones
+        Only one fetch per CID runs at a time
+        Returns: tuple (fetched_at, sessions), or None if the fetch failed
+        """
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(cid, threading.Lock())
+        if not fetch_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return None
+
+        try:
+            with self.lock:
+                cached = self.sessions.get(cid)
+            if cached and not self.is_stale(cached[0], self.stats_ttl):
+                return cached
+
+            stats_response = get_with_retry(STATS_URL.format(cid), max_retries=max_retries)
+            if not stats_response or stats_response.status_code != 200:
+                print(f"Error fetching data for CID {cid} - Status code: {stats_response.status_code if stats_response else 'No response'}")
+                return None
+
+            cached = (monotonic(), json.loads(stats_response.text)['items'])
+            with self.lock:
+                self.sessions[cid] = cached
+            return cached
+        finally:
+            fetch_lock.release()
+
+    def get_sessions(self, cid):
+        """
+        Cached ATC sessions for a CID, even if stale, fetched inline (failing fast) only if nothing is cached
+        Returns: tuple (fetched_at, sessions), or None if nothing could be fetched
+        """
+        with self.lock:
+            cached = self.sessions.get(cid)
+        if cached:
+            return cached
+        return self.fetch_sessions(cid, max_retries=self.lookup_retries, timeout=self.request_delay * 5)
+
+    def get_controller(self, cid):
+        """Activity summary for a single controller, None if not on the roster"""
+        controller = self.get_roster().get(cid)
+        if not controller:
+            return None
+
+        if controller['rating_short'] == "OBS":
+            return {**build_obs_record(controller), 'obs': True, 'inactive': False}
+
+        cached = self.get_sessions(cid)
+        if cached is None:
+            raise Exception(f"Failed to fetch session data for CID {cid}")
+
+        fetched_at, sessions = cached
+        total_hours, positions_worked = calculate_zjx_hours(sessions)
+        return {**public_record(build_controller_record(controller, total_hours, positions_worked)),
+                'obs': False,
+                'inactive': is_inactive(total_hours),
+                'age_seconds': round(monotonic() - fetched_at),
+                'stale': self.is_stale(fetched_at, self.stats_ttl)}
+
+    def get_inactive_controllers(self):
+        """
+        Whole roster inactivity from cached data only, never blocks on the stats API
+        Returns: dict with inactive, obs, processed, pending (members not yet cached)
+        and stale (members whose cached sessions are waiting for a refresh)
+        """
+        inactive_controllers = []
+        obs_controllers = []
+        processed_count = 0
+        pending_count = 0
+        stale_count = 0
+
+        for cid, controller in self.get_roster().items():
+            if controller['rating_short'] == "OBS":
+                obs_controllers.append(build_obs_record(controller))
+                continue
+
+            with self.lock:
+                cached = self.sessions.get(cid)
+            if cached is None:
+                pending_count += 1
+                continue
+
+            fetched_at, sessions = cached
+            if self.is_stale(fetched_at, self.stats_ttl):
+                stale_count += 1
+
+            total_hours, positions_worked = calculate_zjx_hours(sessions)
+            if is_inactive(total_hours):
+                inactive_controllers.append(public_record(build_controller_record(controller, total_hours, positions_worked)))
+            processed_count += 1
+
+        return {
+            'inactive': inactive_controllers,
+            'obs': obs_controllers,
+            'processed': processed_count,
+            'pending': pending_count,
+            'stale': stale_count
+        }
+
+    def warm(self):
+        """Keep refreshing the stale roster and sessions forever, pacing API requests"""
+        while True:
+            try:
+                if self.is_stale(self.roster_fetched, self.roster_ttl):
+                    self.refresh_roster()
+
+                for cid, controller in list(self.get_roster().items()):
+                    if controller['rating_short'] == "OBS":
+                        continue
+                    with self.lock:
+                        cached = self.sessions.get(cid)
+                    if cached and not self.is_stale(cached[0], self.stats_ttl):
+                        continue
+
+                    self.fetch_sessions(cid)
+                    sleep(self.request_delay)
+            except Exception as e:
+                print(f"Error warming cache: {e}")
+
+            sleep(self.request_delay)
+
+def public_record(record):
+    """Controller record without contact details, the service never returns emails"""
+    return {key: value for key, value in record.items() if key != 'email'}
+
+def make_handler(cache):
+    """Build a request handler bound to the given cache"""
+    class ActivityHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            try:
+                if parts == ['inactive']:
+                    self.send_json(200, cache.get_inactive_controllers())
+                elif len(parts) == 2 and parts[0] == 'controller' and parts[1].isdigit():
+                    controller = cache.get_controller(int(parts[1]))
+                    if controller:
+                        self.send_json(200, controller)
+                    else:
+                        self.send_json(404, {'error': f"CID {parts[1]} is not on the roster"})
+                else:
+                    self.send_json(404, {'error': 'Use /controller/<cid> or /inactive'})
+            except Exception as e:
+                self.send_json(502, {'error': str(e)})
+
+    return ActivityHandler
+
+def serve(host='127.0.0.1', port=8080, roster_ttl=900, stats_ttl=3600):
+    """Run the lookup service, warming the cache in the background"""
+    cache = ActivityCache(roster_ttl=roster_ttl, stats_ttl=stats_ttl)
+    threading.Thread(target=cache.warm, daemon=True).start()
+
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    print(f"Serving ZJX activity lookups on http://{host}:{port}")
+    print("  GET /controller/<cid>  Hours for one controller")
+    print("  GET /inactive          Inactive controllers from the warm cache")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping activity service")
+    finally:
+        server.server_close()
@@ -1,7 +1,8 @@
 import argparse
-from zjx_utils import get_inactive_controllers
+from zjx_utils import get_inactive_controllers, merge_shard_results, parse_run_id, parse_shard
 from send_notices import send_all_inactivity_notices
 from roster_actions import process_roster_removals
+from activity_service import serve
 
 def display_inactive_controllers(inactive, obs, total):
     """Pretty print the results"""
@@ -38,18 +39,52 @@ def process_full_removal(inactive, obs, total):
 
 def main():
     parser = argparse.ArgumentParser(description='ZJX Controller Activity Management')
-    parser.add_argument('action', choices=['check', 'send-notices', 'remove'],
+    parser.add_argument('action', choices=['check', 'send-notices', 'remove', 'merge', 'serve'],
                       help='Action to perform (check: just display inactive controllers, '
                            'send-notices: send email notices, '
-                           'remove: send notices AND remove from roster)')
+                           'remove: send notices AND remove from roster, '
+                           'merge: combine and display sharded check results, '
+                           'serve: run the warm-cache activity lookup service)')
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                      help='Only check shard i of N of the roster and write a partial result file (check only)')
+    parser.add_argument('--shard-dir', default='shards',
+                      help='Directory for partial shard result files (default: shards)')
+    parser.add_argument('--from-shards', action='store_true',
+                      help='Use merged shard results instead of checking the roster again (send-notices and remove only)')
+    parser.add_argument('--run-id', type=parse_run_id,
+                      help='Identifier shared by all shards of one sharded check, required with --shard, merge and --from-shards')
+    parser.add_argument('--max-shard-age', type=int, default=24,
+                      help='Refuse to merge shard results older than this many hours (default: 24)')
+    parser.add_argument('--host', default='127.0.0.1',
+                      help='Address for the activity service to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080,
+                      help='Port for the activity service to listen on (default: 8080)')
+    parser.add_argument('--roster-ttl', type=int, default=900,
+                      help='Seconds before the service refreshes the roster (default: 900)')
+    parser.add_argument('--stats-ttl', type=int, default=3600,
+                      help='Seconds before the service refreshes a controller\'s sessions (default: 3600)')
     
     args = parser.parse_args()
     
+    if args.shard and args.action != 'check':
+        parser.error('--shard can only be used with check, run merge once all shards are done')
+    if args.from_shards and args.action not in ['send-notices', 'remove']:
+        parser.error('--from-shards can only be used with send-notices or remove')
+    if (args.shard or args.from_shards or args.action == 'merge') and not args.run_id:
+        parser.error('--run-id is required with --shard, merge and --from-shards')
+    
+    if args.action == 'serve':
+        serve(args.host, args.port, args.roster_ttl, args.stats_ttl)
+        return
+    
     try:
         # Get the data once
-        inactive, obs, total = get_inactive_controllers()
+        if args.action == 'merge' or args.from_shards:
+            inactive, obs, total = merge_shard_results(args.run_id, args.shard_dir, args.max_shard_age)
+        else:
+            inactive, obs, total = get_inactive_controllers(shard=args.shard, shard_dir=args.shard_dir, run_id=args.run_id)
         
-        if args.action == 'check':
+        if args.action in ['check', 'merge']:
             # Just display the results
             display_inactive_controllers(inactive, obs, total)
             
@@ -4,6 +4,7 @@ from typing import List, Dict
 import os
 import dotenv
 from time import sleep
+from zjx_utils import fetch_roster
 
 def get_api_key() -> str:
     """Get VATUSA API key from environment variables"""
@@ -52,6 +53,27 @@ def remove_visiting_controller(facility: str, cid: int, reason: str, api_key: st
     response = requests.delete(url, data=data)
     return response.status_code == 200
 
+def get_roster_snapshot() -> Dict[int, Dict]:
+    """Fetch the current roster (conditionally when possible) indexed by CID"""
+    return {controller['cid']: controller for controller in fetch_roster(conditional=True)}
+
+def reconcile_removals(inactive_controllers: List[Dict], roster: Dict[int, Dict]) -> List[Dict]:
+    """Drop controllers who already left the roster or whose membership changed since the check"""
+    to_remove = []
+    
+    for controller in inactive_controllers:
+        name = f"{controller['first_name']} {controller['last_name']}"
+        current = roster.get(controller['cid'])
+        
+        if not current:
+            print(f"- Skipping {name} (CID: {controller['cid']}), no longer on the roster")
+        elif current['membership'] != controller['membership']:
+            print(f"- Skipping {name} (CID: {controller['cid']}), membership changed from {controller['membership']} to {current['membership']}")
+        else:
+            to_remove.append(controller)
+    
+    return to_remove
+
 def process_roster_removals(inactive_controllers: List[Dict], facility: str = 'ZJX'):
     """Process roster removals with verification steps"""
     
@@ -93,10 +115,40 @@ def process_roster_removals(inactive_controllers: List[Dict], facility: str = 'Z
         print(f"Error: {e}")
         return
     
+    # Reconcile against the current roster right before removing, so no requests
+    # are spent on members who left while the prompts were open
+    print("\n=== ROSTER RECONCILIATION ===")
+    try:
+        roster = get_roster_snapshot()
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+    
+    confirmed_count = len(inactive_controllers)
+    inactive_controllers = reconcile_removals(inactive_controllers, roster)
+    if not inactive_controllers:
+        print("Nothing to remove.")
+        return
+    
+    # Have the operator confirm the reduced list that will actually be removed
+    if len(inactive_controllers) != confirmed_count:
+        print(f"\n{len(inactive_controllers)} of {confirmed_count} controllers still need to be removed:")
+        for controller in inactive_controllers:
+            print(f"  {controller['first_name']} {controller['last_name']} (CID: {controller['cid']}) {controller['membership']}")
+        
+        verification_code = f"{facility}-REMOVE-{len(inactive_controllers)}"
+        print(f"\nPlease type the following verification code to remove these controllers: {verification_code}")
+        user_input = input("Verification code: ")
+        
+        if user_input != verification_code:
+            print("Incorrect verification code. Roster removal cancelled.")
+            return
+    
     # Process removals
     print("\nProcessing roster removals...")
     success_count = 0
     failure_count = 0
+    removed_cids = set()
     
     for controller in inactive_controllers:
         name = f"{controller['first_name']} {controller['last_name']}"
@@ -111,6 +163,7 @@ def process_roster_removals(inactive_controllers: List[Dict], facility: str = 'Z
                 if remove_home_controller(facility, cid, reason, api_key):
                     print(f"✓ Successfully removed home controller {name}")
                     success_count += 1
+                    removed_cids.add(cid)
                 else:
                     print(f"✗ Failed to remove home controller {name}")
                     failure_count += 1
@@ -118,6 +171,7 @@ def process_roster_removals(inactive_controllers: List[Dict], facility: str = 'Z
                 if remove_visiting_controller(facility, cid, reason, api_key):
                     print(f"✓ Successfully removed visiting controller {name}")
                     success_count += 1
+                    removed_cids.add(cid)
                 else:
                     print(f"✗ Failed to remove visiting controller {name}")
                     failure_count += 1
@@ -131,6 +185,23 @@ def process_roster_removals(inactive_controllers: List[Dict], facility: str = 'Z
         # Add a small delay between requests
         sleep(1)
     
+    # Verify every removal against a single post-run roster snapshot
+    print("\n=== REMOVAL VERIFICATION ===")
+    try:
+        roster = get_roster_snapshot()
+        still_listed = [controller for controller in inactive_controllers if controller['cid'] in roster]
+        for controller in still_listed:
+            name = f"{controller['first_name']} {controller['last_name']}"
+            if controller['cid'] in removed_cids:
+                print(f"✗ {name} (CID: {controller['cid']}) is still on the roster despite a successful response")
+            else:
+                print(f"✗ {name} (CID: {controller['cid']}) is still on the roster")
+        success_count = len(inactive_controllers) - len(still_listed)
+        failure_count = len(still_listed)
+        print(f"Verified {success_count} of {len(inactive_controllers)} removals against the roster")
+    except Exception as e:
+        print(f"Error verifying removals, falling back to API responses: {e}")
+    
     # Print summary
     print("\n=== REMOVAL SUMMARY ===")
     print(f"Total controllers processed: {len(inactive_controllers)}")
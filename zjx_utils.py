@@ -1,17 +1,38 @@
 # Core Functionallity
 import requests
 import json
+import os
+import re
+import argparse
+import glob
+import zlib
 from datetime import datetime, timedelta, UTC
 from time import sleep
 from random import uniform
 
-def get_with_retry(url, max_retries=10, base_delay=5):
+ROSTER_URL = "https://api.vatusa.net/v2/facility/ZJX/roster/both"
+STATS_URL = "https://api.vatsim.net/v2/members/{}/atc"
+
+WATCHED_POSITIONS = ['JAX_','MCO_','PNS_','CAE_','CHS_','DAB_','FLO_','MYR_','PAM_','SAV_',
+                     'TLH_','VLD_','VPS_','NBC_','OZR_','SSC_','ABY_','COF_','CRE_','CRG_',
+                     'DHN_','DTS_','ECP_','EGI_','EVB_','EZM_','FIN_','GNV_','HRT_','HXD_',
+                     'ISM_','JKA_','LCQ_','LEE_','LHW_','MLB_','MMT_','NDZ_','NEN_','NFJ_',
+                     'NIP_','_NPA','NRB_','NSE_','OCF_','ORL_','SFB_','SGJ_','SVN_','TIX_',
+                     'TOI_','TTS_','VAD_','VQQ_','XMR_']
+
+# Controllers with fewer ZJX hours than this in the last 90 days are inactive
+INACTIVE_HOURS = 3
+
+# Last roster response, kept so later fetches can be conditional
+_roster_cache = {'etag': None, 'last_modified': None, 'data': None}
+
+def get_with_retry(url, max_retries=10, base_delay=5, headers=None):
     """
     Make a GET request with exponential backoff for rate limiting
     """
     for attempt in range(max_retries):
         try:
-            response = requests.get(url)
+            response = requests.get(url, headers=headers)
             
             # If successful, return response
             if response.status_code == 200:
@@ -37,27 +58,200 @@ def get_with_retry(url, max_retries=10, base_delay=5):
     
     return None
 
-def get_inactive_controllers(batch_size=10):
+def fetch_roster(conditional=False):
     """
-    Collects and returns inactive controller data without taking any action
-    Returns: tuple (inactive_controllers, obs_controllers, total_processed)
+    Fetch the ZJX home and visiting roster
+    If conditional is True and the roster was fetched before, the request is
+    conditional and the cached roster is reused when it has not changed
     """
-    watched_positions = ['JAX_','MCO_','PNS_','CAE_','CHS_','DAB_','FLO_','MYR_','PAM_','SAV_',
-                        'TLH_','VLD_','VPS_','NBC_','OZR_','SSC_','ABY_','COF_','CRE_','CRG_',
-                        'DHN_','DTS_','ECP_','EGI_','EVB_','EZM_','FIN_','GNV_','HRT_','HXD_',
-                        'ISM_','JKA_','LCQ_','LEE_','LHW_','MLB_','MMT_','NDZ_','NEN_','NFJ_',
-                        'NIP_','_NPA','NRB_','NSE_','OCF_','ORL_','SFB_','SGJ_','SVN_','TIX_',
-                        'TOI_','TTS_','VAD_','VQQ_','XMR_']
-    
-    roster_url = "https://api.vatusa.net/v2/facility/ZJX/roster/both"
+    headers = {}
+    if conditional and _roster_cache['data'] is not None:
+        if _roster_cache['etag']:
+            headers['If-None-Match'] = _roster_cache['etag']
+        if _roster_cache['last_modified']:
+            headers['If-Modified-Since'] = _roster_cache['last_modified']
     
-    # Get the roster
-    roster_response = get_with_retry(roster_url)
+    roster_response = get_with_retry(ROSTER_URL, headers=headers or None)
+    if roster_response and roster_response.status_code == 304:
+        return _roster_cache['data']
     if not roster_response or roster_response.status_code != 200:
         raise Exception("Failed to fetch roster data")
-        
+    
     roster_data = json.loads(roster_response.text)
-    return process_batch(roster_data['data'], watched_positions, batch_size)
+    _roster_cache['etag'] = roster_response.headers.get('ETag')
+    _roster_cache['last_modified'] = roster_response.headers.get('Last-Modified')
+    _roster_cache['data'] = roster_data['data']
+    return roster_data['data']
+
+def calculate_zjx_hours(sessions, watched_positions=WATCHED_POSITIONS):
+    """
+    Sum the hours worked on watched positions over the last 90 days
+    Returns: tuple (total_hours, positions_worked)
+    """
+    current_time = datetime.now(UTC)
+    three_months_ago = current_time - timedelta(days=90)
+    
+    total_hours = 0
+    positions_worked = set()
+    for session in sessions:
+        start_time = datetime.strptime(session['connection_id']['start'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC)
+        
+        if start_time >= three_months_ago:
+            callsign = session['connection_id']['callsign']
+            is_zjx_position = any(callsign.startswith(prefix) for prefix in watched_positions)
+            
+            if is_zjx_position:
+                end_time = datetime.strptime(session['connection_id']['end'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC)
+                duration = end_time - start_time
+                duration_hours = duration.total_seconds() / 3600
+                total_hours += duration_hours
+                positions_worked.add(callsign)
+    
+    return total_hours, positions_worked
+
+def is_inactive(total_hours):
+    """Whether a controller's ZJX hours fall below the activity requirement"""
+    return total_hours < INACTIVE_HOURS
+
+def build_obs_record(controller):
+    """Details of an OBS-rated controller excluded from the activity check"""
+    return {
+        'first_name': controller['fname'],
+        'last_name': controller['lname'],
+        'cid': controller['cid']
+    }
+
+def build_controller_record(controller, total_hours, positions_worked):
+    """Controller details in the shape used by the notice and removal steps"""
+    return {
+        'first_name': controller['fname'],
+        'last_name': controller['lname'],
+        'cid': controller['cid'],
+        'email': controller['email'],
+        'hours': round(total_hours, 2),
+        'rating': controller['rating_short'],
+        'positions': sorted(list(positions_worked)),
+        'membership': controller['membership']
+    }
+
+def parse_shard(value):
+    """
+    Parse a shard spec like '2/4' into a (index, count) tuple, index is 1-based
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}', expected i/N (e.g. 1/4)")
+    
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}', index must be between 1 and N")
+    return index, count
+
+def parse_run_id(value):
+    """Validate a shard run id, it becomes part of the shard file names"""
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', value):
+        raise argparse.ArgumentTypeError(f"Invalid run id '{value}', use only letters, digits, '-' and '_'")
+    return value
+
+def shard_for_cid(cid, count):
+    """Shard number (1-based) for a CID, stable across processes and hosts"""
+    return zlib.crc32(str(cid).encode()) % count + 1
+
+def get_shard_path(shard_dir, run_id, index, count):
+    """Path of the partial result file written by a shard worker"""
+    return os.path.join(shard_dir, f"shard_{run_id}_{index}_of_{count}.json")
+
+def get_inactive_controllers(batch_size=10, shard=None, shard_dir='shards', run_id=None):
+    """
+    Collects and returns inactive controller data without taking any action
+    If shard is an (index, count) tuple, only that shard of the roster is
+    processed and the partial result for run_id is written to shard_dir for merging
+    Returns: tuple (inactive_controllers, obs_controllers, total_processed)
+    """
+    controllers = fetch_roster()
+    
+    if not shard:
+        return process_batch(controllers, WATCHED_POSITIONS, batch_size)
+    
+    # Keep only this shard's members, remembering their roster position so
+    # the merged output comes back in the same order as an unsharded run
+    index, count = shard
+    order = {}
+    shard_controllers = []
+    for position, controller in enumerate(controllers):
+        if shard_for_cid(controller['cid'], count) == index:
+            order[controller['cid']] = position
+            shard_controllers.append(controller)
+    print(f"\nShard {index}/{count}: {len(shard_controllers)} of {len(controllers)} roster members")
+    
+    inactive, obs, processed = process_batch(shard_controllers, WATCHED_POSITIONS, batch_size)
+    
+    os.makedirs(shard_dir, exist_ok=True)
+    shard_path = get_shard_path(shard_dir, run_id, index, count)
+    with open(shard_path, 'w') as f:
+        json.dump({
+            'run_id': run_id,
+            'created_at': datetime.now(UTC).isoformat(),
+            'shard': index,
+            'count': count,
+            'order': [[cid, position] for cid, position in order.items()],
+            'inactive': inactive,
+            'obs': obs,
+            'processed': processed
+        }, f, indent=2)
+    print(f"\nWrote shard {index}/{count} results to {shard_path}")
+    
+    return inactive, obs, processed
+
+def merge_shard_results(run_id, shard_dir='shards', max_age_hours=24):
+    """
+    Combines the partial result files written by shard workers for run_id
+    Files from other runs, or older than max_age_hours, are refused
+    Returns: tuple (inactive_controllers, obs_controllers, total_processed)
+    """
+    shard_name = re.compile(rf"shard_{re.escape(run_id)}_\d+_of_\d+\.json")
+    shard_paths = sorted(path for path in glob.glob(os.path.join(shard_dir, 'shard_*.json'))
+                         if shard_name.fullmatch(os.path.basename(path)))
+    if not shard_paths:
+        raise Exception(f"No shard result files for run {run_id} found in {shard_dir}")
+    
+    oldest_allowed = datetime.now(UTC) - timedelta(hours=max_age_hours)
+    shards = {}
+    for shard_path in shard_paths:
+        with open(shard_path) as f:
+            shard_data = json.load(f)
+        if shard_data.get('run_id') != run_id:
+            raise Exception(f"{shard_path} belongs to run {shard_data.get('run_id')}, not {run_id}")
+        if datetime.fromisoformat(shard_data['created_at']) < oldest_allowed:
+            raise Exception(f"{shard_path} is older than {max_age_hours} hours, re-run that shard")
+        shards[(shard_data['shard'], shard_data['count'])] = shard_data
+    
+    counts = {count for _, count in shards}
+    if len(counts) != 1:
+        raise Exception(f"Shard files in {shard_dir} come from different shard counts: {sorted(counts)}")
+    
+    count = counts.pop()
+    missing = [index for index in range(1, count + 1) if (index, count) not in shards]
+    if missing:
+        raise Exception(f"Missing results for shard(s) {', '.join(f'{index}/{count}' for index in missing)}")
+    
+    order = {}
+    inactive_controllers = []
+    obs_controllers = []
+    processed_count = 0
+    for index in range(1, count + 1):
+        shard_data = shards[(index, count)]
+        order.update({cid: position for cid, position in shard_data['order']})
+        inactive_controllers.extend(shard_data['inactive'])
+        obs_controllers.extend(shard_data['obs'])
+        processed_count += shard_data['processed']
+    
+    # Restore roster order
+    inactive_controllers.sort(key=lambda controller: order[controller['cid']])
+    obs_controllers.sort(key=lambda controller: order[controller['cid']])
+    
+    print(f"\nMerged results from {count} shards of run {run_id} in {shard_dir}")
+    return inactive_controllers, obs_controllers, processed_count
 
 def process_batch(controllers, watched_positions, batch_size=10):
     """Process controllers in smaller batches"""
@@ -65,17 +259,12 @@ def process_batch(controllers, watched_positions, batch_size=10):
     obs_controllers = []
     processed_count = 0
     total_controllers = len(controllers)
-    stats_url = "https://api.vatsim.net/v2/members/{}/atc"
     
     # Filter out OBS controllers first
     active_controllers = []
     for controller in controllers:
         if controller['rating_short'] == "OBS":
-            obs_controllers.append({
-                'first_name': controller['fname'],
-                'last_name': controller['lname'],
-                'cid': controller['cid']
-            })
+            obs_controllers.append(build_obs_record(controller))
         else:
             active_controllers.append(controller)
     
@@ -95,43 +284,15 @@ def process_batch(controllers, watched_positions, batch_size=10):
                 first_name = controller['fname']
                 last_name = controller['lname']
                 membership = controller['membership']
-                stats_response = get_with_retry(stats_url.format(cid))
+                stats_response = get_with_retry(STATS_URL.format(cid))
                 
                 if stats_response and stats_response.status_code == 200:
-                    current_time = datetime.now(UTC)
-                    three_months_ago = current_time - timedelta(days=90)
-                    
-                    total_hours = 0
-                    positions_worked = set()
                     stats_data = json.loads(stats_response.text)
-                    
-                    # Calculate total hours
-                    for session in stats_data['items']:
-                        start_time = datetime.strptime(session['connection_id']['start'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC)
-                        
-                        if start_time >= three_months_ago:
-                            callsign = session['connection_id']['callsign']
-                            is_zjx_position = any(callsign.startswith(prefix) for prefix in watched_positions)
-                            
-                            if is_zjx_position:
-                                end_time = datetime.strptime(session['connection_id']['end'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=UTC)
-                                duration = end_time - start_time
-                                duration_hours = duration.total_seconds() / 3600
-                                total_hours += duration_hours
-                                positions_worked.add(callsign)
+                    total_hours, positions_worked = calculate_zjx_hours(stats_data['items'], watched_positions)
                     
                     # Check if controller is inactive
-                    if total_hours < 3:
-                        inactive_controllers.append({
-                            'first_name': first_name,
-                            'last_name': last_name,
-                            'cid': cid,
-                            'email': controller['email'],
-                            'hours': round(total_hours, 2),
-                            'rating': controller['rating_short'],
-                            'positions': sorted(list(positions_worked)),
-                            'membership': membership
-                        })
+                    if is_inactive(total_hours):
+                        inactive_controllers.append(build_controller_record(controller, total_hours, positions_worked))
                     
                     processed_count += 1
                     print(f"Processed {processed_count}/{total_controllers}: {first_name} {last_name} (CID: {cid}) Membership: {membership} - {round(total_hours, 2)} ZJX hours")